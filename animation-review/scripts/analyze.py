@@ -2,16 +2,45 @@
 """Analyze screen recordings using the Gemini video understanding API."""
 
 import argparse
+import asyncio
+import collections
+import functools
+import hashlib
+import itertools
 import json
 import os
+import random
 import shutil
+import socket
+import stat
 import sys
+import tempfile
 import time
+import traceback
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:  # optional speedup — stdlib json produces equivalent output
+    orjson = None
+
 MAX_FPS = 24
 RESULTS_DIR = ".animation-review"
 CLEANUP_AGE_DAYS = 14
+CLEANUP_INTERVAL_SECONDS = 86400
+ARCHIVE_MODES = ("symlink", "copy", "move")
+# Symlinks are free on POSIX; Windows needs elevated rights to create them
+DEFAULT_ARCHIVE_MODE = "symlink" if os.name == "posix" else "copy"
+CACHE_DIR = os.path.join(RESULTS_DIR, "cache")
+CACHE_TTL_DAYS = 7
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+TRIM_MIN_BYTES = 20 * 1024 * 1024
+INLINE_MAX_BYTES = 20 * 1024 * 1024  # Gemini's cap on a whole inline request
+UPLOADS_PATH = os.path.join(RESULTS_DIR, "uploads.json")
+UPLOAD_REUSE_SECONDS = 46 * 3600  # Files API deletes uploads after 48h
+PENDING_BATCHES_PATH = os.path.join(RESULTS_DIR, "pending_batches.json")
+BATCH_ASYNC_MODES = {"check", "review"}  # latency-tolerant modes only
+BATCH_POLL_SECONDS = 30
 
 # ---------------------------------------------------------------------------
 # Modes — each defines FPS, default model, system prompt, and output schema
@@ -110,8 +139,13 @@ implemented in any technology.""",
 }
 
 
+@functools.lru_cache(maxsize=32)
 def build_system_prompt(mode_name, fps):
-    """Build the full system prompt with temporal precision context."""
+    """Build the full system prompt with temporal precision context.
+
+    Pure function of (mode_name, fps), so repeated calls in one process
+    reuse the formatted string.
+    """
     interval_ms = round(1000 / fps)
     preamble = TEMPORAL_PREAMBLE.format(
         fps=fps,
@@ -270,78 +304,312 @@ MODE_SCHEMAS = {
     "inspire": INSPIRE_SCHEMA,
 }
 
+# Canonical serializations, computed once — part of the response cache key so
+# editing a schema invalidates structured results cached under the old one
+MODE_SCHEMA_JSONS = {
+    mode_name: json.dumps(schema, indent=2, sort_keys=True)
+    for mode_name, schema in MODE_SCHEMAS.items()
+}
+
 # Modes where raw output is preferred by default (narrative detail matters more)
 RAW_DEFAULT_MODES = {"diagnose", "inspire"}
 
+# ---------------------------------------------------------------------------
+# JSON helpers — use orjson when installed
+# ---------------------------------------------------------------------------
+
+
+def _json_loads(data):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _json_dumps(obj):
+    """Serialize obj as JSON indented by two spaces."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2)
+
+
 # ---------------------------------------------------------------------------
 # Results persistence & cleanup
 # ---------------------------------------------------------------------------
 
 
+_gitignore_checked = False
+
+
 def ensure_results_dir():
     """Create the results directory and ensure it's gitignored."""
+    global _gitignore_checked
     os.makedirs(RESULTS_DIR, exist_ok=True)
 
+    # The .gitignore check runs at most once per process, and is skipped
+    # entirely once a previous run has left the sentinel behind
+    if _gitignore_checked:
+        return
+    _gitignore_checked = True
+    sentinel = os.path.join(RESULTS_DIR, ".gitignored")
+    if os.path.exists(sentinel):
+        return
+
     # Add to .gitignore if we're in a git repo and it's not already ignored
     gitignore_path = ".gitignore"
     entry = RESULTS_DIR + "/"
     if os.path.isdir(".git"):
-        lines = []
-        if os.path.exists(gitignore_path):
+        # Stream the file and stop at the first match instead of reading it all
+        listed = False
+        missing_newline = False
+        try:
             with open(gitignore_path, "r") as f:
-                lines = f.read().splitlines()
-        if entry not in lines and RESULTS_DIR not in lines:
+                for line in f:
+                    if line.rstrip("\r\n") in (entry, RESULTS_DIR):
+                        listed = True
+                        break
+                    missing_newline = not line.endswith("\n")
+        except FileNotFoundError:
+            pass
+        if not listed:
             with open(gitignore_path, "a") as f:
-                if lines and lines[-1] != "":
+                if missing_newline:
                     f.write("\n")
                 f.write(entry + "\n")
             print(f"Added {entry} to .gitignore", file=sys.stderr)
+        open(sentinel, "w").close()
 
 
-def cleanup_old_results():
-    """Remove files in the results directory older than CLEANUP_AGE_DAYS."""
-    if not os.path.isdir(RESULTS_DIR):
-        return
-    cutoff = time.time() - (CLEANUP_AGE_DAYS * 86400)
+def cleanup_old_results(directory=RESULTS_DIR, max_age_days=CLEANUP_AGE_DAYS):
+    """Remove files in a results directory older than max_age_days.
+
+    Runs at most once a day per directory, tracked by a .last_cleanup stamp.
+    """
+    now = time.time()
+    stamp = os.path.join(directory, ".last_cleanup")
+    try:
+        if os.stat(stamp).st_mtime > now - CLEANUP_INTERVAL_SECONDS:
+            return
+    except FileNotFoundError:
+        pass
+
+    cutoff = now - (max_age_days * 86400)
     removed = 0
-    for name in os.listdir(RESULTS_DIR):
-        path = os.path.join(RESULTS_DIR, name)
-        if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
-            os.remove(path)
-            removed += 1
+    # DirEntry caches file type and stat results from the directory walk
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                # Archived videos may be symlinks; age them by the link itself
+                if not (entry.is_file(follow_symlinks=False) or entry.is_symlink()):
+                    continue
+                if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+    except FileNotFoundError:
+        return  # nothing saved yet
+    open(stamp, "a").close()
+    os.utime(stamp)
     if removed:
-        print(f"Cleaned up {removed} file(s) older than {CLEANUP_AGE_DAYS} days", file=sys.stderr)
+        print(f"Cleaned up {removed} file(s) older than {max_age_days:g} days", file=sys.stderr)
 
 
-def save_results(video_path, mode_name, output_text, use_raw):
-    """Save the video and analysis output to the results directory."""
+def save_results(video_path, results, archive_mode=DEFAULT_ARCHIVE_MODE, archive_video=True):
+    """Save analyses of one video, and the video itself, to the results directory.
+
+    results is a list of (mode_name, output_text, use_raw). The video is
+    archived once, named after the first analysis, and every analysis
+    points at that copy. With archive_video=False the video is left where
+    it is for a later run to archive.
+    """
     ensure_results_dir()
     cleanup_old_results()
 
     stamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
-    base = f"{stamp}_{mode_name}"
-
-    # Save analysis
-    ext = ".md" if use_raw else ".json"
-    analysis_path = os.path.join(RESULTS_DIR, base + ext)
-    with open(analysis_path, "w") as f:
-        f.write(output_text)
+    analysis_paths = []
+    for mode_name, output_text, use_raw in results:
+        base = f"{stamp}_{mode_name}"
+        # Several videos can finish within the same second — keep names unique
+        n = 2
+        while any(os.path.exists(os.path.join(RESULTS_DIR, base + e)) for e in (".md", ".json")):
+            base = f"{stamp}_{mode_name}_{n}"
+            n += 1
+
+        # Save analysis
+        ext = ".md" if use_raw else ".json"
+        analysis_path = os.path.join(RESULTS_DIR, base + ext)
+        with open(analysis_path, "w") as f:
+            f.write(output_text)
+        analysis_paths.append((base, analysis_path))
+
+    if not archive_video:
+        for _, analysis_path in analysis_paths:
+            print(f"Saved → {os.path.abspath(analysis_path)}", file=sys.stderr)
+        return
 
-    # Save video — skip if already in results dir, move from /tmp, copy otherwise
+    # Save video — skip if already in results dir, move from /tmp, otherwise
+    # link, copy, or move according to archive_mode
     video_ext = os.path.splitext(video_path)[1].lower()
-    video_dest = os.path.join(RESULTS_DIR, base + video_ext)
+    video_dest = os.path.join(RESULTS_DIR, analysis_paths[0][0] + video_ext)
     video_abs = os.path.abspath(video_path)
     results_abs = os.path.abspath(RESULTS_DIR)
 
     if os.path.dirname(video_abs) == results_abs:
         # Already in results dir (agent pre-moved it) — just note the existing path
         video_dest = video_path
-    elif video_abs.startswith("/tmp/"):
+    elif video_abs.startswith("/tmp/") or archive_mode == "move":
         shutil.move(video_path, video_dest)
+    elif archive_mode == "symlink" and os.name == "posix":
+        # Records provenance without duplicating a potentially large file
+        os.symlink(video_abs, video_dest)
     else:
         shutil.copy2(video_path, video_dest)
 
-    print(f"Saved → {os.path.abspath(analysis_path)}, {os.path.abspath(video_dest)}", file=sys.stderr)
+    for _, analysis_path in analysis_paths:
+        print(f"Saved → {os.path.abspath(analysis_path)}, {os.path.abspath(video_dest)}", file=sys.stderr)
+
+
+class ResultSaver:
+    """Save each video's analyses once every job that uses the video is done.
+
+    Jobs in one run can share a video, and archiving may move it (always,
+    from /tmp). Saving per job would move the video out from under the
+    jobs still analyzing it, so the video is archived once, after its last
+    job.
+    """
+
+    def __init__(self, jobs):
+        self._remaining = collections.Counter(os.path.abspath(job["video"]) for job in jobs)
+        self._results = collections.defaultdict(list)
+
+    def done(self, job, output_text, use_raw):
+        """Record a finished job; output_text is None if it failed."""
+        key = os.path.abspath(job["video"])
+        if output_text and not job["args"].no_save:
+            self._results[key].append((job["resolved"][4], output_text, use_raw))
+        self._remaining[key] -= 1
+        if self._remaining[key] == 0 and self._results[key]:
+            save_results(job["video"], self._results.pop(key), job["args"].archive_mode)
+
+    def flush(self):
+        """Save analyses still waiting on jobs that finish in a later run.
+
+        Their videos stay in place so that run can still read and archive them.
+        """
+        for video_path, results in self._results.items():
+            save_results(video_path, results, archive_video=False)
+        self._results.clear()
+
+
+# ---------------------------------------------------------------------------
+# Response cache — skip the Gemini round-trip for identical requests
+# ---------------------------------------------------------------------------
+
+
+def _stat_and_hash(video_path):
+    """Return (size, sha256) of a video from a single streamed read.
+
+    The digest identifies the video for the response cache and upload
+    registry; the size is reused for logging and the trim threshold.
+    """
+    size = 0
+    h = hashlib.sha256()
+    # Stream in 1 MiB chunks so large recordings aren't held in memory
+    with open(video_path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            size += len(chunk)
+            h.update(chunk)
+    return size, h.hexdigest()
+
+
+def _request_cache_key(video_digest, mode_name, fps, model, start, end,
+                       user_prompt, system_prompt, use_raw, schema_json, local_trim):
+    """Hash the video digest and every request parameter into a cache key.
+
+    local_trim marks requests whose window is cut locally before upload;
+    their timestamps are relative to the clip, so they can't share a
+    server-side clip's entry.
+    """
+    h = hashlib.sha256(video_digest.encode())
+    # Always stdlib json so keys don't change depending on whether orjson is installed
+    params = [
+        mode_name, fps, model, start, end,
+        user_prompt, system_prompt, use_raw, schema_json, local_trim,
+    ]
+    h.update(json.dumps(params).encode())
+    return h.hexdigest()
+
+
+def load_cached_response(key, ttl_days):
+    """Return the cached entry for key, or None if missing or expired."""
+    path = os.path.join(CACHE_DIR, key + ".json")
+    try:
+        if os.path.getmtime(path) < time.time() - (ttl_days * 86400):
+            os.remove(path)
+            return None
+        with open(path, "rb") as f:
+            return _json_loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def store_cached_response(key, output_text, use_raw, metadata, ttl_days):
+    """Write a response to the cache and prune expired entries."""
+    ensure_results_dir()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cleanup_old_results(CACHE_DIR, ttl_days)
+
+    entry = {
+        "output_text": output_text,
+        "use_raw": use_raw,
+        "metadata": metadata,
+        "ts": time.time(),
+    }
+    with open(os.path.join(CACHE_DIR, key + ".json"), "w") as f:
+        f.write(_json_dumps(entry))
+
+
+def _load_json_file(path):
+    try:
+        with open(path, "rb") as f:
+            return _json_loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json_file(path, obj):
+    """Atomically replace path so a concurrent run never reads half a file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(_json_dumps(obj))
+    os.replace(tmp_path, path)
+
+
+def _load_uploads():
+    return _load_json_file(UPLOADS_PATH)
+
+
+def _remember_upload(video_digest, file_name):
+    """Record a Files API upload so later runs can reuse it."""
+    ensure_results_dir()
+    now = time.time()
+    uploads = {
+        digest: entry for digest, entry in _load_uploads().items()
+        if entry["ts"] > now - UPLOAD_REUSE_SECONDS
+    }
+    uploads[video_digest] = {"name": file_name, "ts": now}
+    _write_json_file(UPLOADS_PATH, uploads)
+
+
+def _store_job_response(job, output_text, use_raw, ttl_days):
+    # --no-save leaves the results directory alone, cache included
+    if job["args"].no_save:
+        return
+    fps, model, _, _, mode_name = job["resolved"]
+    store_cached_response(job["cache_key"], output_text, use_raw, {
+        "video": job["video"],
+        "mode": mode_name,
+        "fps": fps,
+        "model": model,
+        "start": job["args"].start,
+        "end": job["args"].end,
+    }, ttl_days)
 
 
 # ---------------------------------------------------------------------------
@@ -349,7 +617,7 @@ def save_results(video_path, mode_name, output_text, use_raw):
 # ---------------------------------------------------------------------------
 
 
-def parse_args():
+def parse_args(argv=None):
     p = argparse.ArgumentParser(
         description="Analyze animation recordings via Gemini",
         epilog="""
@@ -363,8 +631,14 @@ Modes:
     )
     p.add_argument(
         "-v", "--video",
-        default="/tmp/animation-review.mp4",
-        help="Video file path (default: /tmp/animation-review.mp4)",
+        nargs="+",
+        default=["/tmp/animation-review.mp4"],
+        help="Video file path(s) (default: /tmp/animation-review.mp4)",
+    )
+    p.add_argument(
+        "--batch", metavar="MANIFEST", default=None,
+        help="Analyze every entry of a JSONL manifest ({\"video\", \"mode\", \"prompt\", ...} "
+             "per line) in one process; -v is ignored",
     )
     p.add_argument(
         "-t", "--mode",
@@ -404,11 +678,60 @@ Modes:
         "--no-save", action="store_true",
         help="Don't save results to .animation-review/",
     )
-    return p.parse_args()
+    p.add_argument(
+        "--archive-mode", choices=ARCHIVE_MODES, default=DEFAULT_ARCHIVE_MODE,
+        help="How videos outside /tmp are saved to .animation-review/ "
+             f"(default: {DEFAULT_ARCHIVE_MODE})",
+    )
+    p.add_argument(
+        "--no-cache", action="store_true",
+        help="Always call Gemini, bypassing the response cache",
+    )
+    p.add_argument(
+        "--cache-ttl-days", type=float, default=CACHE_TTL_DAYS,
+        help=f"Reuse cached responses up to this age (default: {CACHE_TTL_DAYS})",
+    )
+    p.add_argument(
+        "--speculate", action="store_true",
+        help="Send the raw-text fallback alongside the structured request "
+             "so a structured failure adds no latency (costs an extra request)",
+    )
+    p.add_argument(
+        "--concurrency", type=int, default=4,
+        help="Max videos analyzed in parallel when several are given (default: 4)",
+    )
+    p.add_argument(
+        "--rpm", type=int, default=None,
+        help="Max Gemini requests per minute across all videos (default: unlimited)",
+    )
+    p.add_argument(
+        "--batch-async", action="store_true",
+        help="Submit to the Gemini Batch API at half the cost and exit with a job ID "
+             "(check and review modes only)",
+    )
+    p.add_argument(
+        "--collect", metavar="JOB_ID", default=None,
+        help="Wait for a --batch-async job, then print and save its results",
+    )
+    warm = p.add_mutually_exclusive_group()
+    warm.add_argument(
+        "--serve", metavar="SOCKET", default=None,
+        help="Stay running and analyze requests from --client over a Unix socket, "
+             "keeping the Gemini SDK imported and its connections warm",
+    )
+    warm.add_argument(
+        "--client", metavar="SOCKET", default=None,
+        help="Hand this run to a --serve process, or run normally if none is listening",
+    )
+    args = p.parse_args(argv)
+    # Semaphore(0) would wait forever without an error
+    if args.concurrency < 1:
+        p.error("--concurrency must be at least 1")
+    return args
 
 
 def resolve_mode(args):
-    """Resolve mode, FPS, model, system prompt, and schema from args."""
+    """Resolve mode, FPS, model, system prompt, and output format from args."""
     mode_name = args.mode or "review"
     mode = MODES[mode_name]
 
@@ -419,7 +742,6 @@ def resolve_mode(args):
 
     model = args.model if args.model is not None else mode["model"]
     system_prompt = build_system_prompt(mode_name, fps)
-    schema = MODE_SCHEMAS[mode_name]
 
     # Determine output format: explicit flags > mode default
     if args.json:
@@ -429,118 +751,913 @@ def resolve_mode(args):
     else:
         use_raw = mode_name in RAW_DEFAULT_MODES
 
-    return fps, model, system_prompt, schema, use_raw, mode_name
+    return fps, model, system_prompt, use_raw, mode_name
 
 
-def main():
-    args = parse_args()
-    fps, model, system_prompt, schema, use_raw, mode_name = resolve_mode(args)
+# ---------------------------------------------------------------------------
+# Gemini analysis
+# ---------------------------------------------------------------------------
 
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        print("Error: GEMINI_API_KEY environment variable not set", file=sys.stderr)
-        sys.exit(1)
 
-    if not os.path.exists(args.video):
-        print(f"Error: Video file not found: {args.video}", file=sys.stderr)
-        sys.exit(1)
+_loop = None
 
-    try:
-        from google import genai
-        from google.genai import types
-    except ImportError:
-        print(
-            "Error: google-genai package not installed. Run: pip install google-genai",
-            file=sys.stderr,
+
+def _run(coro):
+    """Run coro to completion on this process's event loop.
+
+    Unlike asyncio.run, the loop is kept open afterwards, so a --serve
+    process can reuse the client's pooled async connections.
+    """
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
+@functools.lru_cache(maxsize=4)
+def _gemini_client(api_key):
+    """Return a shared client per API key so its HTTP connection pool is reused."""
+    from google import genai
+
+    return genai.Client(api_key=api_key)
+
+
+class RateLimiter:
+    """Allow at most rpm request starts in any rolling 60-second window.
+
+    Gemini quotas are per minute, so a sliding window lets a batch burst up
+    to the quota instead of spacing every request evenly.
+    """
+
+    def __init__(self, rpm):
+        self.rpm = rpm
+        self._starts = collections.deque()
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.rpm:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._starts and self._starts[0] <= now - 60:
+                    self._starts.popleft()
+                if len(self._starts) < self.rpm:
+                    self._starts.append(now)
+                    return
+                await asyncio.sleep(self._starts[0] + 60 - now)
+
+
+async def _call_with_retry(fn, *, max_attempts=3, base=1.0, cap=30.0):
+    """Await fn(), retrying rate limits and transient server errors with backoff.
+
+    Other errors (bad request, auth, unsupported video) fail immediately.
+    """
+    from google.genai import errors
+
+    for attempt in range(max_attempts):
+        try:
+            return await fn()
+        except errors.APIError as e:
+            if e.code not in RETRY_STATUS_CODES or attempt == max_attempts - 1:
+                raise
+            delay = min(cap, base * 2 ** attempt) + random.random() * 0.5
+            print(f"Gemini returned {e.code}, retrying in {delay:.1f}s...", file=sys.stderr)
+            await asyncio.sleep(delay)
+
+
+def _read_video(video_path):
+    with open(video_path, "rb") as f:
+        return f.read()
+
+
+async def _upload_video(client, video_path, mime_type, video_digest, remember=True):
+    """Upload a video via the Files API and wait until it's ready to use.
+
+    Uploads from earlier runs are reused while Gemini still has them, so
+    re-analyzing a video with a different mode or prompt skips the upload.
+    With remember=False (--no-save) a new upload is not recorded.
+    """
+    from google.genai import errors, types
+
+    uploaded = None
+    entry = _load_uploads().get(video_digest)
+    if entry and entry["ts"] > time.time() - UPLOAD_REUSE_SECONDS:
+        try:
+            uploaded = await client.aio.files.get(name=entry["name"])
+        except errors.APIError:
+            uploaded = None  # deleted server-side, or uploaded with another key
+
+    if uploaded is None or uploaded.state == types.FileState.FAILED:
+        uploaded = await _call_with_retry(
+            lambda: client.aio.files.upload(file=video_path, config={"mime_type": mime_type})
         )
-        sys.exit(1)
+        if remember:
+            _remember_upload(video_digest, uploaded.name)
+    else:
+        print(f"Reusing uploaded {video_path} ({uploaded.name})", file=sys.stderr)
 
-    # Determine mime type from extension
-    ext = os.path.splitext(args.video)[1].lower()
-    mime_types = {".mp4": "video/mp4", ".mov": "video/quicktime", ".webm": "video/webm"}
-    mime_type = mime_types.get(ext)
-    if mime_type is None:
-        print(
-            f"Error: Unsupported video format '{ext}'. Use .mp4, .mov, or .webm",
-            file=sys.stderr,
+    while uploaded.state == types.FileState.PROCESSING:
+        await asyncio.sleep(1)
+        uploaded = await client.aio.files.get(name=uploaded.name)
+    if uploaded.state != types.FileState.ACTIVE:
+        raise RuntimeError(f"Gemini could not process {video_path} (state: {uploaded.state})")
+    return uploaded
+
+
+_upload_tasks = {}
+
+
+def _shared_upload(client, video_path, mime_type, video_digest, remember=True):
+    """Return the in-flight upload for this video, starting one if needed.
+
+    Batch entries that analyze the same video in several modes share a
+    single upload instead of racing to upload it twice.
+    """
+    task = _upload_tasks.get(video_digest)
+    if task is None:
+        task = asyncio.ensure_future(
+            _upload_video(client, video_path, mime_type, video_digest, remember)
         )
-        sys.exit(1)
+        _upload_tasks[video_digest] = task
+    return task
 
-    # Read video
-    with open(args.video, "rb") as f:
-        video_bytes = f.read()
-    size_mb = len(video_bytes) / (1024 * 1024)
 
-    range_str = ""
-    if args.start or args.end:
-        range_str = f" [{args.start or '0s'}–{args.end or 'end'}]"
-    print(
-        f"[{mode_name}] Analyzing {args.video} ({size_mb:.1f}MB){range_str} at {fps}fps with {model}...",
-        file=sys.stderr,
+async def _video_part(client, video_path, mime_type, video_size, video_digest, video_metadata,
+                      remember=True):
+    """Reference the video by Files API URI, falling back to inline bytes."""
+    from google.genai import errors, types
+
+    try:
+        uploaded = await _shared_upload(client, video_path, mime_type, video_digest, remember)
+        return types.Part(
+            file_data=types.FileData(file_uri=uploaded.uri, mime_type=mime_type),
+            video_metadata=video_metadata,
+        )
+    except errors.ClientError as e:
+        # Inline requests over the cap are rejected too — don't read the file for nothing
+        if video_size > INLINE_MAX_BYTES:
+            raise
+        print(f"File upload rejected ({e}), sending video inline...", file=sys.stderr)
+
+    # Read off the event loop so other videos' requests stay in flight
+    video_bytes = await asyncio.to_thread(_read_video, video_path)
+    return types.Part(
+        inline_data=types.Blob(data=video_bytes, mime_type=mime_type),
+        video_metadata=video_metadata,
     )
 
-    client = genai.Client(api_key=api_key)
 
-    user_prompt = "Analyze the animations in this screen recording."
-    if args.prompt:
-        user_prompt += f"\n\nContext: {args.prompt}"
+@functools.lru_cache(maxsize=32)
+def _generate_config(mode_name, fps, structured):
+    """Return the GenerateContentConfig for a mode at an FPS, built once.
+
+    Only structured configs carry a schema — raw runs and the raw fallback
+    never send one.
+    """
+    from google.genai import types
+
+    if not structured:
+        return types.GenerateContentConfig(system_instruction=build_system_prompt(mode_name, fps))
+    return types.GenerateContentConfig(
+        system_instruction=build_system_prompt(mode_name, fps),
+        response_mime_type="application/json",
+        response_schema=MODE_SCHEMAS[mode_name],
+    )
+
+
+def _video_metadata(fps, start, end):
+    """Build video metadata with FPS and optional time range."""
+    from google.genai import types
 
-    # Build video metadata with FPS and optional time range
     video_meta_kwargs = {"fps": fps}
-    if args.start:
-        video_meta_kwargs["start_offset"] = args.start
-    if args.end:
-        video_meta_kwargs["end_offset"] = args.end
+    if start:
+        video_meta_kwargs["start_offset"] = start
+    if end:
+        video_meta_kwargs["end_offset"] = end
+    return types.VideoMetadata(**video_meta_kwargs)
+
+
+def _offset_seconds(offset):
+    """Convert a '3s' / '1.5s' style offset into seconds."""
+    return float(offset[:-1] if offset.endswith("s") else offset)
+
+
+def _clip_start_note(clip_start):
+    """Header line for raw output analyzed from a locally trimmed clip."""
+    minutes, seconds = divmod(clip_start, 60)
+    return (
+        f"Clip starts at {clip_start:g}s ({int(minutes):02d}:{seconds:04.1f}) in the "
+        f"original recording. Timestamps below are relative to the clip.\n\n"
+    )
+
+
+async def _trim_video(video_path, start, end):
+    """Cut [start, end] into a temp mp4 with ffmpeg; return its path or None.
+
+    Input seeking (-ss before -i) skips straight to the window, and
+    re-encoding keeps the cut frame-accurate — a stream copy would start on
+    the previous keyframe and shift every timestamp the model reports.
+    """
+    cmd = ["ffmpeg", "-nostdin", "-y"]
+    if start:
+        cmd += ["-ss", str(_offset_seconds(start))]
+    cmd += ["-i", video_path]
+    if end:
+        duration = _offset_seconds(end) - (_offset_seconds(start) if start else 0)
+        cmd += ["-t", str(duration)]
+    fd, trimmed_path = tempfile.mkstemp(prefix="animation-review-", suffix=".mp4")
+    os.close(fd)
+    cmd += [
+        "-an", "-vcodec", "libx264", "-crf", "23", "-preset", "veryfast",
+        "-pix_fmt", "yuv420p", trimmed_path,
+    ]
+
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        os.remove(trimmed_path)
+        return None
+    _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        print(f"ffmpeg trim failed, clipping server-side instead: {stderr.decode()[-500:]}", file=sys.stderr)
+        os.remove(trimmed_path)
+        return None
+    return trimmed_path
+
+
+async def analyze_one(client, job, sem, limiter):
+    """Send one job's video to Gemini and return (output_text, use_raw)."""
+    args = job["args"]
+    video_path = job["video"]
+    async with sem:
+        # Large recordings are trimmed locally so only the window is uploaded;
+        # small ones upload quickly and are clipped server-side
+        trimmed_path = None
+        if (args.start or args.end) and job["size"] > TRIM_MIN_BYTES:
+            trimmed_path = await _trim_video(video_path, args.start, args.end)
+
+        if trimmed_path is None:
+            return await _generate(
+                client, job, video_path, job["mime_type"], job["size"], job["digest"],
+                limiter, start=args.start, end=args.end,
+            )
+
+        print(f"Trimmed {video_path} to {args.start or '0s'}–{args.end or 'end'} before upload", file=sys.stderr)
+        trimmed_digest = hashlib.sha256(
+            f"{job['digest']}:{args.start}:{args.end}".encode()
+        ).hexdigest()
+        try:
+            return await _generate(
+                client, job, trimmed_path, "video/mp4", os.path.getsize(trimmed_path),
+                trimmed_digest, limiter,
+                clip_start=_offset_seconds(args.start) if args.start else 0,
+            )
+        finally:
+            os.remove(trimmed_path)
+
+
+async def _generate(client, job, video_path, mime_type, video_size, video_digest,
+                    limiter, start=None, end=None, clip_start=0):
+    """Upload one video and run the Gemini request(s) for it.
+
+    clip_start is where a locally trimmed clip starts in the original
+    recording. The model's timestamps stay relative to the clip, and the
+    result states the offset instead of trusting the model to add it.
+    """
+    from google.genai import types
+
+    args = job["args"]
+    user_prompt = job["user_prompt"]
+    note = _clip_start_note(clip_start) if clip_start else ""
+    fps, model, _, use_raw, mode_name = job["resolved"]
+
+    size_mb = video_size / (1024 * 1024)
 
+    range_str = ""
+    if start or end:
+        range_str = f" [{start or '0s'}–{end or 'end'}]"
+    print(
+        f"[{mode_name}] Analyzing {video_path} ({size_mb:.1f}MB){range_str} at {fps}fps with {model}...",
+        file=sys.stderr,
+    )
+
+    # Uploaded once and shared by the structured call and raw fallback
+    video_part = await _video_part(
+        client, video_path, mime_type, video_size, video_digest,
+        _video_metadata(fps, start, end), remember=not args.no_save,
+    )
     contents = [
         types.Content(
             role="user",
             parts=[
-                types.Part(
-                    inline_data=types.Blob(data=video_bytes, mime_type=mime_type),
-                    video_metadata=types.VideoMetadata(**video_meta_kwargs),
-                ),
+                video_part,
                 types.Part.from_text(text=user_prompt),
             ],
         )
     ]
 
+    async def request(config):
+        await limiter.wait()
+        return await client.aio.models.generate_content(
+            model=model, contents=contents, config=config,
+        )
+
+    async def stream_raw():
+        """Print raw text as it's generated and return the full text."""
+        await limiter.wait()
+        chunks = []
+        try:
+            async for chunk in await client.aio.models.generate_content_stream(
+                model=model, contents=contents, config=raw_config,
+            ):
+                if chunk.text:
+                    if note and not chunks:
+                        sys.stdout.write(note)
+                        chunks.append(note)
+                    sys.stdout.write(chunk.text)
+                    sys.stdout.flush()
+                    chunks.append(chunk.text)
+        except Exception as e:
+            if chunks:
+                # A retry would print the beginning again
+                sys.stdout.write("\n")
+                raise RuntimeError(f"response stream interrupted: {e}") from e
+            raise
+        sys.stdout.write("\n")
+        job["streamed"] = True
+        return "".join(chunks)
+
+    raw_config = _generate_config(mode_name, fps, structured=False)
     output_text = None
 
+    # With --speculate the raw fallback is already in flight, so a structured
+    # failure costs no extra round trip (at the price of a second request)
+    raw_task = None
+    if not use_raw and args.speculate:
+        raw_task = asyncio.create_task(_call_with_retry(lambda: request(raw_config)))
+
     # Structured JSON output
     if not use_raw:
         try:
-            response = client.models.generate_content(
-                model=model,
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    system_instruction=system_prompt,
-                    response_mime_type="application/json",
-                    response_schema=schema,
-                ),
+            response = await _call_with_retry(
+                lambda: request(_generate_config(mode_name, fps, structured=True))
             )
-            result = json.loads(response.text)
-            output_text = json.dumps(result, indent=2)
-            print(output_text)
+            result = _json_loads(response.text)
+            if clip_start and isinstance(result, dict):
+                result = {"clip_start_seconds": clip_start, **result}
+            output_text = _json_dumps(result)
         except Exception as e:
             print(f"Structured output failed ({e}), falling back to raw text...", file=sys.stderr)
             use_raw = True
 
     # Raw text output (or fallback)
     if use_raw:
-        response = client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-            ),
+        if raw_task is not None:
+            output_text = (await raw_task).text
+        elif job.get("stream"):
+            output_text = await _call_with_retry(stream_raw)
+        else:
+            output_text = (await _call_with_retry(lambda: request(raw_config))).text
+        if not job.get("streamed"):
+            output_text = note + output_text
+    elif raw_task is not None:
+        raw_task.cancel()
+        # Wait for the cancellation to finish: _run never drains the loop, so a
+        # task left pending here would never run its cleanup
+        await asyncio.gather(raw_task, return_exceptions=True)
+
+    return output_text, use_raw
+
+
+def emit_result(job, output_text, show_header, out=None):
+    """Print an analysis to out (stdout by default)."""
+    out = out or sys.stdout
+    mode_name = job["resolved"][4]
+    if not job.get("streamed"):
+        # One write per result so concurrent results can never interleave
+        header = f"==> {job['video']} [{mode_name}] <==\n" if show_header else ""
+        out.write(f"{header}{output_text}\n")
+        out.flush()
+
+
+async def run_analyses(client, args, jobs, show_header, saver):
+    """Analyze all cache-miss jobs concurrently; return the number that failed."""
+    sem = asyncio.Semaphore(args.concurrency)
+    limiter = RateLimiter(args.rpm)
+    # A lone raw result is printed as it's generated; several would
+    # interleave, so those are printed whole under their headers
+    for job in jobs:
+        job["stream"] = not show_header
+
+    async def run(job):
+        output_text = use_raw = None
+        try:
+            output_text, use_raw = await analyze_one(client, job, sem, limiter)
+            if job["cache_key"] and output_text:
+                _store_job_response(job, output_text, use_raw, args.cache_ttl_days)
+            emit_result(job, output_text, show_header)
+        finally:
+            saver.done(job, output_text, use_raw)
+
+    results = await asyncio.gather(
+        *(run(job) for job in jobs), return_exceptions=True,
+    )
+    failed = 0
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            print(f"Error: analysis failed for {job['video']}: {result}", file=sys.stderr)
+            failed += 1
+    return failed
+
+
+# ---------------------------------------------------------------------------
+# Batch API — half-price, non-interactive runs collected later
+# ---------------------------------------------------------------------------
+
+
+async def submit_batches(client, jobs):
+    """Upload the jobs' videos and submit one Batch API job per model.
+
+    Returns the submitted job names. Each job is recorded in
+    pending_batches.json with what --collect needs to emit and save its
+    results the same way a synchronous run would.
+    """
+    from google.genai import types
+
+    # Batch requests can only reference uploaded files, never inline bytes;
+    # the time range is clipped server-side instead of trimmed locally
+    uploads = await asyncio.gather(*(
+        _shared_upload(
+            client, job["video"], job["mime_type"], job["digest"], not job["args"].no_save,
         )
-        output_text = response.text
-        print(output_text)
+        for job in jobs
+    ))
+
+    by_model = {}
+    for job, uploaded in zip(jobs, uploads):
+        by_model.setdefault(job["resolved"][1], []).append((job, uploaded))
+
+    names = []
+    for model, model_jobs in by_model.items():
+        requests = []
+        entries = []
+        for job, uploaded in model_jobs:
+            fps, _, _, use_raw, mode_name = job["resolved"]
+            config = _generate_config(mode_name, fps, structured=not use_raw)
+            video_part = types.Part(
+                file_data=types.FileData(file_uri=uploaded.uri, mime_type=job["mime_type"]),
+                video_metadata=_video_metadata(fps, job["args"].start, job["args"].end),
+            )
+            requests.append(types.InlinedRequest(
+                contents=[types.Content(
+                    role="user",
+                    parts=[video_part, types.Part.from_text(text=job["user_prompt"])],
+                )],
+                config=config,
+            ))
+            entries.append({
+                "video": job["video"],
+                "args": vars(job["args"]),
+                "cache_key": job["cache_key"],
+            })
+
+        batch = await _call_with_retry(lambda: client.aio.batches.create(
+            model=model, src=requests, config={"display_name": "animation-review"},
+        ))
+        if jobs[0]["args"].no_save:
+            # --collect needs the record, but --no-save leaves .gitignore alone
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+        else:
+            ensure_results_dir()
+        pending = _load_json_file(PENDING_BATCHES_PATH)
+        pending[batch.name] = {"model": model, "ts": time.time(), "entries": entries}
+        _write_json_file(PENDING_BATCHES_PATH, pending)
+        print(f"Submitted {len(requests)} request(s) to {model} as {batch.name}", file=sys.stderr)
+        names.append(batch.name)
+    return names
+
+
+def collect_batch(client, args, job_name):
+    """Poll a --batch-async job until it finishes; return the number of failures."""
+    from google.genai import types
+
+    pending = _load_json_file(PENDING_BATCHES_PATH)
+    record = pending.get(job_name)
+    if record is None:
+        print(f"Error: {job_name} is not in {PENDING_BATCHES_PATH}", file=sys.stderr)
+        sys.exit(1)
+
+    done_states = {
+        types.JobState.JOB_STATE_SUCCEEDED,
+        types.JobState.JOB_STATE_FAILED,
+        types.JobState.JOB_STATE_CANCELLED,
+        types.JobState.JOB_STATE_EXPIRED,
+    }
+    batch = client.batches.get(name=job_name)
+    while batch.state not in done_states:
+        print(f"{job_name}: {batch.state.name}, checking again in {BATCH_POLL_SECONDS}s...", file=sys.stderr)
+        time.sleep(BATCH_POLL_SECONDS)
+        batch = client.batches.get(name=job_name)
+
+    if batch.state != types.JobState.JOB_STATE_SUCCEEDED:
+        print(f"Error: {job_name} ended in {batch.state.name}: {batch.error}", file=sys.stderr)
+        failed = len(record["entries"])
+    else:
+        entries = record["entries"]
+        show_header = len(entries) > 1
+        failed = 0
+        jobs = []
+        for entry in entries:
+            job_args = argparse.Namespace(**entry["args"])
+            if not os.path.exists(entry["video"]):
+                print(f"Warning: {entry['video']} no longer exists, not saving", file=sys.stderr)
+                job_args.no_save = True
+            jobs.append({
+                "args": job_args,
+                "video": entry["video"],
+                "cache_key": entry["cache_key"],
+                "resolved": resolve_mode(job_args),
+            })
+        saver = ResultSaver(jobs)
+
+        # Inlined responses come back in the order the requests were submitted
+        responses = batch.dest.inlined_responses or []
+        if len(responses) != len(jobs):
+            print(
+                f"Warning: {job_name} returned {len(responses)} response(s) "
+                f"for {len(jobs)} request(s)",
+                file=sys.stderr,
+            )
+        for job, inlined in itertools.zip_longest(jobs, responses[:len(jobs)]):
+            if inlined is None:
+                print(f"Error: analysis failed for {job['video']}: no response returned", file=sys.stderr)
+                failed += 1
+                saver.done(job, None, None)
+                continue
+
+            # A blocked or empty response has no text even without an error
+            output_text = inlined.response.text if inlined.response else None
+            if inlined.error or not output_text:
+                reason = inlined.error or "empty or blocked response"
+                print(f"Error: analysis failed for {job['video']}: {reason}", file=sys.stderr)
+                failed += 1
+                saver.done(job, None, None)
+                continue
+
+            use_raw = job["resolved"][3]
+            if not use_raw:
+                try:
+                    output_text = _json_dumps(_json_loads(output_text))
+                except ValueError as e:
+                    print(f"Structured output failed ({e}), keeping raw text...", file=sys.stderr)
+                    use_raw = True
+
+            if job["cache_key"] and output_text:
+                _store_job_response(job, output_text, use_raw, args.cache_ttl_days)
+            emit_result(job, output_text, show_header)
+            saver.done(job, output_text, use_raw)
+
+    del pending[job_name]
+    _write_json_file(PENDING_BATCHES_PATH, pending)
+    return failed
+
+
+MIME_TYPES = {".mp4": "video/mp4", ".mov": "video/quicktime", ".webm": "video/webm"}
+
+# Manifest fields (and their JSON types) that override the matching CLI option for one entry
+MANIFEST_FIELDS = {
+    "video": str, "mode": str, "prompt": str, "start": str, "end": str,
+    "fps": int, "model": str,
+}
+
 
-    # Save results
-    if not args.no_save and output_text:
-        save_results(args.video, mode_name, output_text, use_raw)
+def load_manifest(manifest_path, args):
+    """Read a JSONL manifest into (per-entry args, video path) pairs."""
+    entries = []
+    with open(manifest_path, "r") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            where = f"{manifest_path}:{lineno}"
+            try:
+                entry = _json_loads(line)
+            except ValueError as e:
+                print(f"Error: {where}: invalid JSON ({e})", file=sys.stderr)
+                sys.exit(1)
+            if not isinstance(entry, dict) or "video" not in entry:
+                print(f"Error: {where}: each line needs at least a \"video\" field", file=sys.stderr)
+                sys.exit(1)
+            unknown = set(entry) - set(MANIFEST_FIELDS)
+            if unknown:
+                print(f"Error: {where}: unknown field(s) {', '.join(sorted(unknown))}", file=sys.stderr)
+                sys.exit(1)
+            for field, value in entry.items():
+                # bool is an int subclass, but "fps": true is a mistake
+                if not isinstance(value, MANIFEST_FIELDS[field]) or isinstance(value, bool):
+                    expected = "an integer" if MANIFEST_FIELDS[field] is int else "a string"
+                    print(f"Error: {where}: \"{field}\" must be {expected}, got {_json_dumps(value)}",
+                          file=sys.stderr)
+                    sys.exit(1)
+            if entry.get("mode", "review") not in MODES:
+                print(f"Error: {where}: unknown mode '{entry['mode']}'", file=sys.stderr)
+                sys.exit(1)
+            video_path = entry.pop("video")
+            entries.append((argparse.Namespace(**{**vars(args), **entry}), video_path))
+    return entries
+
+
+def prepare_job(job_args, video_path):
+    """Validate one input and resolve everything needed to analyze it."""
+    if not os.path.exists(video_path):
+        print(f"Error: Video file not found: {video_path}", file=sys.stderr)
+        sys.exit(1)
+
+    # Determine mime type from extension
+    ext = os.path.splitext(video_path)[1].lower()
+    mime_type = MIME_TYPES.get(ext)
+    if mime_type is None:
+        print(
+            f"Error: Unsupported video format '{ext}'. Use .mp4, .mov, or .webm",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    resolved = resolve_mode(job_args)
+    fps, model, system_prompt, use_raw, mode_name = resolved
+
+    user_prompt = "Analyze the animations in this screen recording."
+    if job_args.prompt:
+        user_prompt += f"\n\nContext: {job_args.prompt}"
+
+    video_size, video_digest = _stat_and_hash(video_path)
+    cache_key = None
+    if not job_args.no_cache:
+        cache_key = _request_cache_key(
+            video_digest, mode_name, fps, model, job_args.start, job_args.end,
+            user_prompt, system_prompt, use_raw,
+            None if use_raw else MODE_SCHEMA_JSONS[mode_name],
+            # The Batch API always clips server-side, never trimming locally
+            bool(job_args.start or job_args.end) and video_size > TRIM_MIN_BYTES
+            and not job_args.batch_async,
+        )
+
+    return {
+        "args": job_args,
+        "video": video_path,
+        "mime_type": mime_type,
+        "size": video_size,
+        "digest": video_digest,
+        "cache_key": cache_key,
+        "resolved": resolved,
+        "user_prompt": user_prompt,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Warm server — skip the SDK import and TLS setup on repeat runs
+# ---------------------------------------------------------------------------
+#
+# Protocol: one JSON line per message. The client sends
+# {"argv": [...], "cwd": "..."}; the server replies with any number of
+# {"fd": 1 or 2, "data": "..."} lines and finishes with {"exit": code}.
+
+
+class _SocketStream:
+    """File-like object that forwards writes to the client as one stream."""
+
+    def __init__(self, conn, fd):
+        self.conn = conn
+        self.fd = fd
+
+    def write(self, data):
+        if data:
+            self.conn.sendall(json.dumps({"fd": self.fd, "data": data}).encode() + b"\n")
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def _handle_request(conn):
+    global _gitignore_checked
+
+    with conn, conn.makefile("rb") as f:
+        try:
+            request = json.loads(f.readline())
+        except ValueError:
+            return
+        os.chdir(request["cwd"])
+        # Per-run state that must not leak into the next run
+        _gitignore_checked = False
+        _upload_tasks.clear()
+
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = _SocketStream(conn, 1), _SocketStream(conn, 2)
+        code = 0
+        try:
+            main(request["argv"], forwarded=True)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (1 if e.code else 0)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        conn.sendall(json.dumps({"exit": code}).encode() + b"\n")
+
+
+def _remove_stale_socket(socket_path):
+    """Remove a socket left behind by a server that didn't exit cleanly.
+
+    Exits instead if the path is not a socket, or if a server is still
+    listening on it.
+    """
+    try:
+        st = os.lstat(socket_path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(st.st_mode):
+        print(f"Error: {socket_path} exists and is not a socket", file=sys.stderr)
+        sys.exit(1)
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.remove(socket_path)
+        return
+    except OSError as e:
+        print(f"Error: cannot check {socket_path}: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        probe.close()
+    print(f"Error: another analyze.py server is already listening on {socket_path}", file=sys.stderr)
+    sys.exit(1)
+
+
+def serve(socket_path):
+    """Analyze requests from --client one at a time until interrupted."""
+    socket_path = os.path.abspath(socket_path)
+    _remove_stale_socket(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    # Requests run with this process's API key — keep other users out
+    os.chmod(socket_path, 0o600)
+    bound = os.lstat(socket_path)
+    server.listen()
+    print(f"Serving on {socket_path} (Ctrl-C to stop)", file=sys.stderr)
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                _handle_request(conn)
+            except OSError as e:
+                print(f"Client disconnected: {e}", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        # Only remove the socket if it is still ours, not a replacement
+        try:
+            st = os.lstat(socket_path)
+            if (st.st_dev, st.st_ino) == (bound.st_dev, bound.st_ino):
+                os.remove(socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def forward_to_server(socket_path, argv):
+    """Run argv on a --serve process; return its exit code, or None if none is up."""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        client.close()
+        return None
+
+    streams = {1: sys.stdout, 2: sys.stderr}
+    with client, client.makefile("rb") as f:
+        client.sendall(json.dumps({"argv": argv, "cwd": os.getcwd()}).encode() + b"\n")
+        for line in f:
+            message = json.loads(line)
+            if "exit" in message:
+                return message["exit"]
+            streams[message["fd"]].write(message["data"])
+            streams[message["fd"]].flush()
+    print("Error: analyze.py server closed the connection", file=sys.stderr)
+    return 1
+
+
+def _without_option(argv, flag):
+    """Return argv minus flag and its value."""
+    result = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == flag:
+            skip = True
+        elif not arg.startswith(flag + "="):
+            result.append(arg)
+    return result
+
+
+def _require_genai():
+    try:
+        from google import genai  # noqa: F401
+    except ImportError:
+        print(
+            "Error: google-genai package not installed. Run: pip install google-genai",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+def main(argv=None, forwarded=False):
+    args = parse_args(argv)
+
+    # A forwarded run can still name the socket through an abbreviation
+    # (--cli) that _without_option doesn't strip; forwarding it again would
+    # wait on this same server forever
+    if args.client and not forwarded:
+        argv = sys.argv[1:] if argv is None else argv
+        code = forward_to_server(args.client, _without_option(argv, "--client"))
+        if code is not None:
+            sys.exit(code)
+        print(f"No analyze.py server on {args.client}, running directly", file=sys.stderr)
+
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        print("Error: GEMINI_API_KEY environment variable not set", file=sys.stderr)
+        sys.exit(1)
+
+    if args.serve:
+        _require_genai()
+        _gemini_client(api_key)  # build the shared client before the first request
+        serve(args.serve)
+        return
+
+    if args.collect:
+        _require_genai()
+        if collect_batch(_gemini_client(api_key), args, args.collect):
+            sys.exit(1)
+        return
+
+    if args.batch:
+        entries = load_manifest(args.batch, args)
+    else:
+        entries = [(args, video_path) for video_path in args.video]
+
+    # Validate every input up front so a typo doesn't fail halfway through a batch
+    prepared = [prepare_job(job_args, video_path) for job_args, video_path in entries]
+    if args.batch_async:
+        slow = sorted({job["resolved"][4] for job in prepared} - BATCH_ASYNC_MODES)
+        if slow:
+            print(
+                f"Error: --batch-async supports {' and '.join(sorted(BATCH_ASYNC_MODES))} "
+                f"modes only, not {', '.join(slow)}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+    show_header = len(prepared) > 1
+    saver = ResultSaver(prepared)
+    jobs = []
+    for job in prepared:
+        if job["cache_key"]:
+            cached = load_cached_response(job["cache_key"], args.cache_ttl_days)
+            if cached is not None:
+                mode_name = job["resolved"][4]
+                print(f"[{mode_name}] Using cached analysis for {job['video']} (--no-cache to re-run)", file=sys.stderr)
+                # --batch-async keeps stdout for job IDs, so scripts can capture them
+                emit_result(job, cached["output_text"], show_header,
+                            sys.stderr if args.batch_async else None)
+                saver.done(job, cached["output_text"], cached["use_raw"])
+                continue
+        jobs.append(job)
+
+    if not jobs:
+        return
+
+    _require_genai()
+    client = _gemini_client(api_key)
+    if args.batch_async:
+        for name in _run(submit_batches(client, jobs)):
+            print(name)
+        print("Collect results with --collect <job-id>", file=sys.stderr)
+        # --collect archives the videos of submitted jobs with their results
+        saver.flush()
+        return
+
+    failed = _run(run_analyses(client, args, jobs, show_header, saver))
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
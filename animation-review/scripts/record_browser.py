@@ -2,13 +2,32 @@
 """Record browser interactions with Playwright's built-in video capture."""
 
 import argparse
+import collections
+import concurrent.futures
+import functools
 import os
+import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 
 RECORDING_FPS = 24
+DEFAULT_MAX_WIDTH = 1280
+FFMPEG_STDERR_TAIL_LINES = 200
+# Kept before the first action when trimming page load — the wall-clock
+# timeline is approximate, and the model needs the pre-interaction state
+TRIM_LEAD_SECONDS = 1.0
+
+# H.264 encoders in order of preference, with roughly CRF-23-equivalent settings.
+# Hardware encoders run on fixed-function silicon and leave the CPU free.
+ENCODERS = {
+    "h264_videotoolbox": ["-b:v", "4M", "-allow_sw", "1", "-pix_fmt", "yuv420p"],
+    "h264_nvenc": ["-preset", "p4", "-rc", "vbr", "-cq", "23", "-pix_fmt", "yuv420p"],
+    "h264_qsv": ["-global_quality", "23", "-pix_fmt", "nv12"],
+    "libx264": ["-crf", "23", "-preset", "veryfast", "-pix_fmt", "yuv420p"],
+}
 
 
 def parse_args():
@@ -38,6 +57,14 @@ Examples:
         default=[],
         help="Action to perform (repeatable, executed in order)",
     )
+    p.add_argument(
+        "--parallel-url",
+        nargs="+",
+        default=[],
+        metavar="URL",
+        help="More URLs to record at the same time with the same actions; "
+             "outputs are numbered (e.g. /tmp/animation-review-1.mp4)",
+    )
     p.add_argument(
         "-o",
         "--output",
@@ -50,6 +77,23 @@ Examples:
     p.add_argument(
         "-H", "--height", type=int, default=720, help="Viewport height (default: 720)"
     )
+    p.add_argument(
+        "--max-width",
+        type=int,
+        default=DEFAULT_MAX_WIDTH,
+        help=f"Downscale wider recordings to this width (default: {DEFAULT_MAX_WIDTH})",
+    )
+    p.add_argument(
+        "--container",
+        choices=["mp4", "webm"],
+        default="mp4",
+        help="Output container; webm keeps Playwright's recording as-is and skips ffmpeg (default: mp4)",
+    )
+    p.add_argument(
+        "--no-trim",
+        action="store_true",
+        help="Keep the page load before the first action (mp4 only; always kept for webm)",
+    )
     p.add_argument(
         "--headed", action="store_true", help="Run in headed mode (visible browser)"
     )
@@ -68,48 +112,203 @@ Examples:
     return p.parse_args()
 
 
-def execute_action(page, action_str):
-    """Parse and execute a single action string."""
-    parts = action_str.split(":", 1)
-    cmd = parts[0]
-    arg = parts[1] if len(parts) > 1 else ""
-
-    if cmd == "wait":
-        page.wait_for_timeout(int(arg))
-    elif cmd == "click":
-        page.click(arg)
-    elif cmd == "scroll":
-        page.mouse.wheel(0, int(arg))
-    elif cmd == "hover":
-        page.hover(arg)
-    elif cmd == "press":
-        page.keyboard.press(arg)
-    elif cmd == "type":
-        sel, text = arg.split("|", 1)
-        page.fill(sel, text)
-    else:
-        print(f"Unknown action: {cmd}", file=sys.stderr)
+def compile_action(action_str):
+    """Parse a single action string into a function that performs it on a page.
+
+    Called for every action before the browser launches, so a typo fails
+    immediately instead of after page load.
+    """
+    cmd, _, arg = action_str.partition(":")
+
+    try:
+        if cmd == "wait":
+            ms = int(arg)
+            return lambda page: page.wait_for_timeout(ms)
+        if cmd == "scroll":
+            pixels = int(arg)
+            return lambda page: page.mouse.wheel(0, pixels)
+        if cmd == "type":
+            sel, text = arg.split("|", 1)
+            return lambda page: page.fill(sel, text)
+    except ValueError:
+        print(f"Invalid action: {action_str}", file=sys.stderr)
         sys.exit(1)
 
+    if cmd in ("click", "hover", "press") and not arg:
+        missing = "key" if cmd == "press" else "selector"
+        print(f"Invalid action: {action_str} (missing {missing})", file=sys.stderr)
+        sys.exit(1)
+    if cmd == "click":
+        return lambda page: page.click(arg)
+    if cmd == "hover":
+        return lambda page: page.hover(arg)
+    if cmd == "press":
+        return lambda page: page.keyboard.press(arg)
+
+    print(f"Unknown action: {cmd}", file=sys.stderr)
+    sys.exit(1)
 
-def main():
-    args = parse_args()
 
+def probe_codec(video_path):
+    """Return the first video stream's codec name, or None if unknown."""
     try:
-        from playwright.sync_api import sync_playwright
-    except ImportError:
-        print(
-            "Error: playwright not installed. Run: pip install playwright && playwright install chromium",
-            file=sys.stderr,
+        result = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-select_streams", "v:0",
+                "-show_entries", "stream=codec_name",
+                "-of", "default=noprint_wrappers=1:nokey=1",
+                video_path,
+            ],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+        )
+    except FileNotFoundError:
+        return None
+    return result.stdout.strip() or None
+
+
+class FfmpegRun:
+    """A running ffmpeg whose stderr is drained in the background."""
+
+    def __init__(self, cmd):
+        self.proc = subprocess.Popen(
+            cmd,
+            # Only stderr is used (for the failure message); never let ffmpeg poll stdin
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        # Drain stderr as it arrives so ffmpeg never stalls on a full pipe while
+        # the browser shuts down, keeping only the tail for the failure message
+        self.tail = collections.deque(maxlen=FFMPEG_STDERR_TAIL_LINES)
+        self.reader = threading.Thread(
+            target=self.tail.extend, args=(self.proc.stderr,), daemon=True,
+        )
+        self.reader.start()
+
+    def wait(self):
+        """Wait for ffmpeg to exit; return (returncode, tail of its stderr)."""
+        self.proc.wait()
+        self.reader.join()
+        self.proc.stderr.close()
+        return self.proc.returncode, b"".join(self.tail).decode(errors="replace")
+
+
+def encode_cmd(video_path, output, max_width, encoder, start=0):
+    # Input seeking skips decoding the cut frames; re-encoding keeps it frame-accurate
+    seek = ["-ss", f"{start:.3f}"] if start else []
+    return [
+        "ffmpeg", "-nostdin", "-nostats", "-y",
+        *seek, "-i", video_path,
+        "-r", str(RECORDING_FPS),
+        # Gemini samples a downscaled view anyway — smaller frames encode and upload faster
+        "-vf", f"scale='trunc(min({max_width},iw)/2)*2':-2:flags=bilinear",
+        "-vcodec", encoder, *ENCODERS[encoder],
+        output,
+    ]
+
+
+def encoder_works(encoder):
+    """Encode one synthetic frame to check the hardware behind an encoder exists."""
+    try:
+        result = subprocess.run(
+            [
+                "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+                "-f", "lavfi", "-i", "color=s=256x256",
+                "-frames:v", "1", "-vcodec", encoder, *ENCODERS[encoder],
+                "-f", "null", "-",
+            ],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            timeout=10,
         )
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return result.returncode == 0
+
+
+_encoder_lock = threading.Lock()
+
+
+def pick_encoder():
+    """Return the most preferred H.264 encoder that works on this machine."""
+    # --parallel-url recordings share one probe instead of racing to run their own
+    with _encoder_lock:
+        return detect_encoder()
+
+
+@functools.lru_cache(maxsize=None)
+def detect_encoder():
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+        )
+    except FileNotFoundError:
+        return "libx264"
+    available = {line.split()[1] for line in result.stdout.splitlines() if len(line.split()) > 1}
+    # Stock builds list nvenc/qsv even without the GPU to run them, so try
+    # each one once rather than failing every transcode before falling back
+    return next(
+        name for name in ENCODERS
+        if name == "libx264" or (name in available and encoder_works(name))
+    )
+
+
+def start_transcode(video_path, output, max_width, start=0):
+    """Launch ffmpeg converting the recording to mp4, remuxing when already h264.
+
+    start drops everything before that many seconds. Returns (run, encoder)
+    for finish_transcode; encoder is None for a remux.
+    """
+    # A stream copy can only cut on keyframes, which would shift the
+    # timeline, so trimmed recordings are always re-encoded
+    if not start and probe_codec(video_path) == "h264":
+        # Same codec — rewrap the existing stream instead of re-encoding pixels
+        print("Remuxing h264 stream to mp4...", file=sys.stderr)
+        run = FfmpegRun([
+            "ffmpeg", "-nostdin", "-nostats", "-y",
+            "-i", video_path,
+            "-c:v", "copy", "-an", "-movflags", "+faststart",
+            output,
+        ])
+        return run, None
+
+    # Transcode webm → mp4 at 24fps
+    encoder = pick_encoder()
+    print(f"Transcoding to {RECORDING_FPS}fps mp4 ({encoder})...", file=sys.stderr)
+    return FfmpegRun(encode_cmd(video_path, output, max_width, encoder, start)), encoder
+
+
+def finish_transcode(run, encoder, video_path, output, max_width, start=0):
+    """Wait for a transcode started by start_transcode, exiting on failure."""
+    returncode, stderr = run.wait()
+    if returncode != 0 and encoder not in (None, "libx264"):
+        # Encoders can be compiled in without the hardware to back them
+        print(f"{encoder} failed, retrying with libx264...", file=sys.stderr)
+        run = FfmpegRun(encode_cmd(video_path, output, max_width, "libx264", start))
+        returncode, stderr = run.wait()
+
+    if returncode != 0:
+        print(f"ffmpeg transcode failed: {stderr}", file=sys.stderr)
         sys.exit(1)
 
-    if not args.action:
-        print("Warning: no actions specified, recording page load only", file=sys.stderr)
+
+def record_one(args, actions, url, output, label=""):
+    """Record one URL, convert it to the output container, and return its path.
+
+    Each call drives its own Playwright instance — the sync API must not be
+    shared across threads — so --parallel-url can run several at once.
+    """
+    from playwright.sync_api import sync_playwright
 
     video_dir = tempfile.mkdtemp(prefix="animation-review-")
 
-    print(f"Recording {args.url} → {args.output} (at {RECORDING_FPS}fps)", file=sys.stderr)
+    print(f"{label}Recording {url} → {output} (at {RECORDING_FPS}fps)", file=sys.stderr)
 
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=not args.headed)
@@ -121,54 +320,98 @@ def main():
         page = context.new_page()
         recording_start = time.monotonic()
 
-        page.goto(args.url, wait_until="networkidle")
+        page.goto(url, wait_until="networkidle")
         page.wait_for_timeout(args.wait_before)
 
-        actions_start = time.monotonic() - recording_start
-        for action in args.action:
-            t = time.monotonic() - recording_start
-            print(f"  → {action} (at {t:.1f}s)", file=sys.stderr)
-            execute_action(page, action)
-        actions_end = time.monotonic() - recording_start
+        # Page load before the actions is dead video — cut it in the
+        # transcode so Gemini never samples it. Times below are relative
+        # to the trimmed output.
+        trim_start = 0
+        if actions and args.container == "mp4" and not args.no_trim:
+            trim_start = max(0, time.monotonic() - recording_start - TRIM_LEAD_SECONDS)
+
+        actions_start = time.monotonic() - recording_start - trim_start
+        for action, perform in actions:
+            t = time.monotonic() - recording_start - trim_start
+            print(f"{label}  → {action} (at {t:.1f}s)", file=sys.stderr)
+            perform(page)
+        actions_end = time.monotonic() - recording_start - trim_start
 
         page.wait_for_timeout(args.wait_after)
 
         video_path = page.video.path()
-        total_duration = time.monotonic() - recording_start
+        total_duration = time.monotonic() - recording_start - trim_start
         context.close()
-        browser.close()
 
-    # Print timeline summary for use with analyze.py --start/--end
-    print(f"Timeline: actions {actions_start:.1f}s–{actions_end:.1f}s, total {total_duration:.1f}s", file=sys.stderr)
+        # Print timeline summary for use with analyze.py --start/--end
+        if trim_start:
+            print(f"{label}Trimmed {trim_start:.1f}s of page load (--no-trim to keep it)", file=sys.stderr)
+        print(
+            f"{label}Timeline: actions {actions_start:.1f}s–{actions_end:.1f}s, total {total_duration:.1f}s",
+            file=sys.stderr,
+        )
 
-    # Transcode webm → mp4 at 24fps
-    print(f"Transcoding to {RECORDING_FPS}fps mp4...", file=sys.stderr)
-    result = subprocess.run(
-        [
-            "ffmpeg", "-y",
-            "-i", video_path,
-            "-r", str(RECORDING_FPS),
-            "-vcodec", "libx264", "-crf", "23", "-preset", "fast", "-pix_fmt", "yuv420p",
-            args.output,
-        ],
-        capture_output=True,
-    )
-    if result.returncode != 0:
-        print(f"ffmpeg transcode failed: {result.stderr.decode()}", file=sys.stderr)
-        sys.exit(1)
+        # The video is finalized once the context closes, so encoding can
+        # run while the browser and Playwright shut down
+        transcode_job = None
+        if args.container == "mp4":
+            transcode_job = start_transcode(video_path, output, args.max_width, trim_start)
+        browser.close()
+
+    if transcode_job is None:
+        # Playwright already wrote a webm that analyze.py accepts — no transcode
+        output = os.path.splitext(output)[0] + ".webm"
+        shutil.move(video_path, output)
+    else:
+        finish_transcode(*transcode_job, video_path, output, args.max_width, trim_start)
 
     # Cleanup temp webm
     try:
         os.remove(video_path)
+    except OSError:
+        pass
+    try:
         os.rmdir(video_dir)
     except OSError:
         pass
 
-    size = os.path.getsize(args.output)
+    size = os.path.getsize(output)
     size_str = f"{size / 1024:.0f}KB" if size < 1024 * 1024 else f"{size / (1024 * 1024):.1f}MB"
-    print(f"Done — {size_str} → {args.output}", file=sys.stderr)
-    # stdout: just the path, for piping into analyze.py
-    print(args.output)
+    print(f"{label}Done — {size_str} → {output}", file=sys.stderr)
+    return output
+
+
+def main():
+    args = parse_args()
+
+    try:
+        import playwright.sync_api  # noqa: F401
+    except ImportError:
+        print(
+            "Error: playwright not installed. Run: pip install playwright && playwright install chromium",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    actions = [(action, compile_action(action)) for action in args.action]
+    if not actions:
+        print("Warning: no actions specified, recording page load only", file=sys.stderr)
+
+    urls = [args.url, *args.parallel_url]
+    if len(urls) == 1:
+        outputs = [record_one(args, actions, args.url, args.output)]
+    else:
+        # Recordings are independent, so total time is the slowest one
+        # rather than the sum; each thread also runs its own ffmpeg
+        stem, ext = os.path.splitext(args.output)
+        paths = [f"{stem}-{i}{ext}" for i in range(1, len(urls) + 1)]
+        labels = [f"[{i}] " for i in range(1, len(urls) + 1)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(urls)) as pool:
+            outputs = list(pool.map(functools.partial(record_one, args, actions), urls, paths, labels))
+
+    # stdout: just the path(s), for piping into analyze.py
+    for output in outputs:
+        print(output)
 
 
 if __name__ == "__main__":